@@ -0,0 +1,201 @@
+"""
+Columnar export of the live model (Entity._all_entities and
+EntityProperty._instances) to Arrow tables, without going through rdflib.
+
+export_tables returns:
+    {
+        "entities": Table(uri, class, label),
+        "edges": {<relationship name>: Table(subject, object)},
+        "properties": {<shape name>: Table(id, entity, property, value, unit, ...)},
+    }
+Each shape gets its own property table, with columns typed from the shape's
+field annotations; any fields besides value and hasUnit become extra columns.
+Ints given for a float field are stored as floats and flagged in a
+<field>_is_int column (only present if there are any), so they load as ints. There is a row for
+each entity an entity property is attached to (or a single row with no entity
+if it is not attached), and rows of the same entity property share its id.
+URIs, classes and other strings are dictionary-encoded. Use Table.to_pandas()
+for DataFrames, and write_parquet/read_parquet to save and load the tables.
+
+load_tables rebuilds the model from the tables using a BrickClassGenerator.
+"""
+import os
+import typing
+from collections import defaultdict
+import rdflib
+import pyarrow as pa
+import pyarrow.parquet as pq
+from upper import Unit, Entity, EntityProperty
+
+
+def _strings(values):
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+# Arrow types of the numeric field annotations
+NUMERIC_TYPES = {float: pa.float64(), int: pa.int64()}
+
+
+def _field_type(annotation):
+    # unwraps Optional[X]
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if typing.get_origin(annotation) is typing.Union and len(args) == 1:
+        return args[0]
+    return annotation
+
+
+def _columns(name, annotation, values):
+    """
+    Returns the columns for a field with the given annotation and values
+    """
+    ftype = _field_type(annotation)
+    if ftype in NUMERIC_TYPES:
+        columns = {name: pa.array(values, type=NUMERIC_TYPES[ftype])}
+        if ftype is float and any(isinstance(v, int) for v in values):
+            columns[f"{name}_is_int"] = pa.array([isinstance(v, int) for v in values])
+        return columns
+    if all(v is None or isinstance(v, str) for v in values):
+        return {name: _strings(values)}
+    return {name: pa.array(values)}
+
+
+def _to_python(val):
+    if isinstance(val, (Entity, EntityProperty, Unit)):
+        return str(val.URI)
+    elif isinstance(val, rdflib.term.Node):
+        return str(val)
+    return val
+
+
+def export_tables(entities=None, properties=None):
+    """
+    Exports entities (defaults to all constructed entities) and entity
+    properties to Arrow tables. If entities is given, only the edges between
+    those entities are exported, and properties defaults to the entity
+    properties attached to them; otherwise it defaults to all constructed
+    entity properties. Attachments to entities which are not exported are left out.
+    """
+    subset = entities is not None
+    if entities is None:
+        entities = Entity._all_entities
+    exported = {id(ent) for ent in entities}
+
+    edges = defaultdict(lambda: ([], []))
+    owners = defaultdict(list)
+    for ent in entities:
+        for propname in ent._properties:
+            for val in getattr(ent, propname):
+                if isinstance(val, EntityProperty):
+                    owners[id(val)].append((str(ent.URI), propname))
+                elif id(val) in exported:
+                    subjects, objects = edges[propname]
+                    subjects.append(str(ent.URI))
+                    objects.append(str(val.URI))
+
+    if properties is None:
+        properties = EntityProperty._instances
+        if subset:
+            properties = [ep for ep in properties if id(ep) in owners]
+
+    shape_rows = defaultdict(list)
+    shape_counts = defaultdict(int)
+    for ep in properties:
+        shape = type(ep).__name__
+        ep_id = shape_counts[shape]
+        shape_counts[shape] += 1
+        for (ent, propname) in owners.get(id(ep)) or [(None, None)]:
+            shape_rows[shape].append((ep, ep_id, ent, propname))
+    property_tables = {}
+    for shape, rows in shape_rows.items():
+        columns = {
+            "id": pa.array([row[1] for row in rows], type=pa.int64()),
+            "entity": _strings([row[2] for row in rows]),
+            "property": _strings([row[3] for row in rows]),
+        }
+        for field, annotation in type(rows[0][0]).__annotations__.items():
+            column = "unit" if field == "hasUnit" else field
+            values = [_to_python(getattr(row[0], field)) for row in rows]
+            columns.update(_columns(column, annotation, values))
+        property_tables[shape] = pa.table(columns)
+
+    return {
+        "entities": pa.table({
+            "uri": _strings([str(ent.URI) for ent in entities]),
+            "class": _strings([str(ent.classURI) for ent in entities]),
+            "label": _strings([ent.entity_label for ent in entities]),
+        }),
+        "edges": {
+            propname: pa.table({"subject": _strings(subjects), "object": _strings(objects)})
+            for propname, (subjects, objects) in edges.items()
+        },
+        "properties": property_tables,
+    }
+
+
+def write_parquet(tables, directory):
+    """
+    Writes the tables from export_tables to Parquet files under directory
+    """
+    os.makedirs(os.path.join(directory, "edges"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "properties"), exist_ok=True)
+    pq.write_table(tables["entities"], os.path.join(directory, "entities.parquet"))
+    for group in ("edges", "properties"):
+        for name, table in tables[group].items():
+            pq.write_table(table, os.path.join(directory, group, f"{name}.parquet"))
+
+
+def read_parquet(directory):
+    """
+    Reads tables written by write_parquet
+    """
+    tables = {"entities": pq.read_table(os.path.join(directory, "entities.parquet"))}
+    for group in ("edges", "properties"):
+        tables[group] = {}
+        for fname in sorted(os.listdir(os.path.join(directory, group))):
+            name = fname[:-len(".parquet")]
+            tables[group][name] = pq.read_table(os.path.join(directory, group, fname))
+    return tables
+
+
+def load_tables(tables, brick):
+    """
+    Rebuilds the model described by tables (from export_tables or read_parquet)
+    using the classes of the BrickClassGenerator brick. Returns a dict of the
+    created entities keyed by URI.
+    """
+    entities = {}
+    classes = {}
+    table = tables["entities"]
+    for (uri, cls, label) in zip(*(table.column(c).to_pylist() for c in ("uri", "class", "label"))):
+        if cls not in classes:
+            classes[cls] = getattr(brick, cls.split('#')[-1])
+        entities[uri] = classes[cls](rdflib.URIRef(uri), label)
+
+    for propname, table in tables["edges"].items():
+        for (subj, obj) in zip(table.column("subject").to_pylist(), table.column("object").to_pylist()):
+            getattr(entities[subj], f"add_{propname}")(entities[obj])
+
+    units = {u.URI: u for u in vars(brick.Unit).values() if isinstance(u, Unit)}
+    for shape, table in tables["properties"].items():
+        kls = getattr(brick.EntityProperty, shape)
+        columns = {}
+        for field, annotation in kls.__annotations__.items():
+            values = table.column("unit" if field == "hasUnit" else field).to_pylist()
+            if field == "hasUnit":
+                values = [units[rdflib.URIRef(v)] if v is not None else None for v in values]
+            elif "URIRef" in str(annotation):
+                values = [rdflib.URIRef(v) if v is not None else None for v in values]
+            elif f"{field}_is_int" in table.column_names:
+                is_int = table.column(f"{field}_is_int").to_pylist()
+                values = [int(v) if flag else v for (v, flag) in zip(values, is_int)]
+            columns[field] = values
+        # rows with the same id are attachments of the same entity property
+        eps = {}
+        rows = zip(table.column("id").to_pylist(), table.column("entity").to_pylist(),
+                   table.column("property").to_pylist())
+        for i, (ep_id, ent, propname) in enumerate(rows):
+            if ep_id not in eps:
+                eps[ep_id] = kls(**{field: values[i] for field, values in columns.items()})
+            if ent is not None:
+                getattr(entities[ent], f"add_{propname}")(eps[ep_id])
+    return entities
@@ -1,12 +1,15 @@
+import os
 import rdflib
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import re
 import ast
 from enum import Enum
 import brickschema
+import pyshacl
 from brickschema import namespaces as ns
 from typing import Optional
 import shapegen
+import store
 from upper import Unit, Entity, EntityProperty
 
 def rev(s):
@@ -25,6 +28,10 @@ def make_enum(enum_name, enum_vals):
     return Enum(enum_name, vals)
 
 
+QUDT_UNITS = "http://qudt.org/vocab/unit/"
+# number of pruned (shapes, ontology) graph pairs kept by validation_graphs
+VALIDATION_CACHE_SIZE = 64
+
 class placeholder:
     pass
 
@@ -34,12 +41,15 @@ class BrickClassGenerator:
     EntityProperty = placeholder()
     Unit = placeholder()
 
-    def __init__(self, brick_graph: Optional[rdflib.Graph] = None):
+    def __init__(self, brick_graph: Optional[rdflib.Graph] = None, qudt_source: str = QUDT_UNITS):
         if brick_graph is not None:
             self.graph = brick_graph
         else:
             self.graph = brickschema.Graph(load_brick_nightly=True)
-        self.graph.parse("http://qudt.org/vocab/unit/", format="ttl")
+        # qudt_source can be a local copy of the QUDT units to run offline, or
+        # None if brick_graph already contains them (e.g. from store.open_graph)
+        if qudt_source is not None:
+            self.graph.parse(qudt_source, format="ttl")
 
         self._build_equipment()
         self._build_points()
@@ -48,6 +58,7 @@ class BrickClassGenerator:
         self._build_shapes()
 
         self._build_shape_class(ns.BRICK["CoolingCapacityShape"])
+        self._index_shapes()
 
         # get possible relationships
         res = self.graph.query("""SELECT ?prop ?dom ?rng WHERE {
@@ -280,6 +291,98 @@ class BrickClassGenerator:
 
 
 
+    def _index_shapes(self):
+        """
+        Indexes the shapes in the graph by the classes and predicates that
+        target them, so validation only needs the shapes relevant to a model
+        """
+        # like pyshacl, treat anything with a target as a shape, whatever its
+        # type (Brick 1.2 has e.g. bsh:hasLocationShape a sh:Nodeshape)
+        self._shapes = set(self.graph.subjects(ns.A, ns.SH.NodeShape))
+        self._shapes.update(self.graph.subjects(ns.A, ns.SH.PropertyShape))
+        for target in (ns.SH.targetClass, ns.SH.targetSubjectsOf, ns.SH.targetObjectsOf,
+                       ns.SH.targetNode, ns.SH.target):
+            self._shapes.update(self.graph.subjects(target, None))
+        self._shapes_by_class = defaultdict(set)
+        self._shapes_by_predicate = defaultdict(set)
+        self._shapes_always = set()
+        self._validation_cache = OrderedDict()
+        for shape in self._shapes:
+            # shapes can be targeted implicitly by being the class of a node
+            self._shapes_by_class[shape].add(shape)
+            for cls in self.graph.objects(shape, ns.SH.targetClass):
+                self._shapes_by_class[cls].add(shape)
+            for pred in self.graph.objects(shape, ns.SH.targetSubjectsOf):
+                self._shapes_by_predicate[pred].add(shape)
+            for pred in self.graph.objects(shape, ns.SH.targetObjectsOf):
+                self._shapes_by_predicate[pred].add(shape)
+            if (shape, ns.SH.targetNode, None) in self.graph or \
+               (shape, ns.SH.target, None) in self.graph:
+                self._shapes_always.add(shape)
+
+    def validation_graphs(self, classes, predicates, nodes=()):
+        """
+        Returns a (shapes, ontology) pair of graphs for validating a model which
+        uses the given classes and predicates, and refers to the given nodes
+        (e.g. units) defined outside of the model. The shapes graph contains only
+        the NodeShapes which can target those classes and predicates (and
+        everything they reference); the ontology graph contains the types of the
+        nodes and the subclass hierarchy above all classes, which SHACL needs
+        for sh:targetClass and sh:class. The most recently used results are
+        cached on the arguments.
+        """
+        key = (frozenset(classes), frozenset(predicates), frozenset(nodes))
+        if key in self._validation_cache:
+            self._validation_cache.move_to_end(key)
+            return self._validation_cache[key]
+
+        ontology = rdflib.Graph()
+        ancestors = set()
+        stack = list(classes)
+        for node in nodes:
+            for cls in self.graph.objects(node, ns.A):
+                ontology.add((node, ns.A, cls))
+                stack.append(cls)
+                if cls == ns.QUDT.Unit:
+                    # Brick's hasUnit range shape requires unit:Unit, but QUDT
+                    # types its units as qudt:Unit
+                    ontology.add((node, ns.A, ns.UNIT.Unit))
+        while stack:
+            cls = stack.pop()
+            if cls in ancestors:
+                continue
+            ancestors.add(cls)
+            for parent in self.graph.objects(cls, ns.RDFS.subClassOf):
+                if isinstance(parent, rdflib.BNode):
+                    continue
+                ontology.add((cls, ns.RDFS.subClassOf, parent))
+                stack.append(parent)
+
+        roots = set(self._shapes_always)
+        for cls in ancestors:
+            roots.update(self._shapes_by_class.get(cls, ()))
+        for pred in predicates:
+            roots.update(self._shapes_by_predicate.get(pred, ()))
+
+        shapes = rdflib.Graph()
+        visited = set()
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if node in visited:
+                continue
+            visited.add(node)
+            for (pred, obj) in self.graph.predicate_objects(node):
+                shapes.add((node, pred, obj))
+                if isinstance(obj, rdflib.BNode) or obj in self._shapes:
+                    stack.append(obj)
+
+        self._validation_cache[key] = (shapes, ontology)
+        if len(self._validation_cache) > VALIDATION_CACHE_SIZE:
+            self._validation_cache.popitem(last=False)
+        return shapes, ontology
+
+
 # TODO: handle dtype (need to handle *lists* of possible dtypes)
 def add_property_to_class(target, propname, dtypes=None):
     def f(self, ent: Entity):
@@ -297,38 +400,111 @@ def _brick_repr(self):
     return f"<BRICK {self._class_label}: {self.URI}>"
 
 
-def compile_model(binds):
+def compile_model(binds, fast=False, brick=None, validate=True):
+    """
+    Builds a Brick graph from all constructed entities and entity properties.
+
+    The graph is validated against the shapes from brick (defaults to the
+    module-level Brick generator) which are relevant to the model. Note this is
+    stricter than before, when the graph was validated without any of the
+    Brick shapes and so always passed; use validate=False for that. If fast is
+    True, the entity property nodes are left out of validation: their
+    constraints (required values, datatypes, allowed values and units) are
+    already enforced when the shape classes are instantiated. Only the
+    entities, their relationships and the types of the entity property nodes
+    they point to are validated.
+
+    If validate is False, the graph is returned without any validation.
+    """
     g = brickschema.Graph()
+    classes = set()
+    predicates = set()
+    ep_classes = set()
+    ep_predicates = set()
+    # external nodes (units) the entities and entity properties point to
+    nodes = set()
+    ep_nodes = set()
     for (pfx, namespace) in binds:
         g.bind(pfx, namespace)
     for ent in Entity._all_entities:
         g.add((ent.URI, ns.A, ent.classURI))
+        classes.add(ent.classURI)
         for propname in ent._properties:
             prop = BrickClassGenerator._propname_lookup[propname]
+            predicates.add(prop)
             for propval in getattr(ent, propname):
                 g.add((ent.URI, prop, propval.URI))
+                if isinstance(propval, Unit):
+                    nodes.add(propval.URI)
+    # the fields of entity property nodes; kept apart so fast validation can
+    # leave them out
+    props = rdflib.Graph()
     for ep in shapegen.EntityProperty._instances:
         g.add((ep.URI, ns.A, ep.classURI))
+        ep_classes.add(ep.classURI)
         for prop_name in ep.__annotations__.keys():
+            ep_predicates.add(shapegen.prop_lookup[prop_name])
             val = getattr(ep, prop_name)
-            if isinstance(val, (Entity, EntityProperty, Unit)):
-                g.add((ep.URI, shapegen.prop_lookup[prop_name], val.URI))
+            if isinstance(val, Unit):
+                props.add((ep.URI, shapegen.prop_lookup[prop_name], val.URI))
+                ep_nodes.add(val.URI)
+            elif isinstance(val, (Entity, EntityProperty)):
+                props.add((ep.URI, shapegen.prop_lookup[prop_name], val.URI))
             elif isinstance(val, rdflib.URIRef):
-                g.add((ep.URI, shapegen.prop_lookup[prop_name], val))
+                props.add((ep.URI, shapegen.prop_lookup[prop_name], val))
             else:
-                g.add((ep.URI, shapegen.prop_lookup[prop_name], rdflib.Literal(val)))
-
-    valid, _, report = g.validate()
-    if not valid:
-        raise Exception(report)
+                props.add((ep.URI, shapegen.prop_lookup[prop_name], rdflib.Literal(val)))
+
+    if validate:
+        if brick is None:
+            brick = default_generator()
+        if fast:
+            shapes, ontology = brick.validation_graphs(classes, predicates, nodes)
+            data = g + ontology
+        else:
+            shapes, ontology = brick.validation_graphs(classes | ep_classes, predicates | ep_predicates,
+                                                     nodes | ep_nodes)
+            data = g + props + ontology
+        # validate a copy of the data graph with the (small) ontology fragment
+        # mixed in; pyshacl's ont_graph would drop the types of external nodes
+        valid, _, report = pyshacl.validate(data, shacl_graph=shapes)
+        if not valid:
+            raise Exception(report)
+    g += props
     return g
 
-g = brickschema.Graph().load_file("Brick.ttl")
-Brick = BrickClassGenerator(g)
+_default = None
+
+
+def default_generator():
+    """
+    Returns the module-level generator (mason.Brick), building it on first use
+    from MASON_STORE if set, or else from Brick.ttl and MASON_QUDT (defaults to
+    the QUDT units online)
+    """
+    global _default
+    if _default is None:
+        if "MASON_STORE" in os.environ:
+            # shared on-disk ontology built with store.py; already includes QUDT
+            _default = BrickClassGenerator(store.open_graph(os.environ["MASON_STORE"]), qudt_source=None)
+        else:
+            g = brickschema.Graph().load_file("Brick.ttl")
+            _default = BrickClassGenerator(g, qudt_source=os.environ.get("MASON_QUDT", QUDT_UNITS))
+    return _default
+
+
+def __getattr__(name):
+    # Brick is built on first access rather than on import, so importing mason
+    # to build a generator from another source does not fetch QUDT
+    if name == "Brick":
+        return default_generator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 #Brick11 = BrickClassGenerator(brickschema.Graph(brick_version="1.1"))
 #Brick12 = BrickClassGenerator(brickschema.Graph(brick_version="1.2"))
 
 if __name__ == '__main__':
+    Brick = default_generator()
     BLDG = rdflib.Namespace("example#")
 
     ahu1 = Brick.AHU(BLDG["ahu1"], "ahu #1")
@@ -359,7 +535,7 @@ if __name__ == '__main__':
     bldg.add_hasPart(fl1)
     rm1 = Brick.Room(BLDG["room1"], "Room 1")
     fl1.add_hasPart(rm1)
-    rm1.add_area(Brick.EntityProperty.AreaShape(10, Brick.Unit.Quad))
+    rm1.add_area(Brick.EntityProperty.AreaShape(10, Brick.Unit.Square_Metre))
 
     graph = compile_model([
         ("bldg", BLDG)
@@ -0,0 +1,69 @@
+"""
+Measures the memory of concurrent worker processes which each build the
+generator, either parsing the ontology into memory or opening a shared store.
+
+    python scratch/bench_store.py path/to/unit.ttl [workers]
+
+Run from the repository root. The store is built next to the QUDT file.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def memory():
+    # Pss splits shared pages (e.g. the memory-mapped store) between processes
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, *rest = line.split()
+            if key in ("Rss:", "Pss:"):
+                usage[key[:-1].lower()] = int(rest[0]) // 1024
+    return usage
+
+
+if sys.argv[1] == "worker":
+    if sys.argv[2] == "baseline":
+        import brickschema, pyshacl, shapegen, store
+    else:
+        import mason
+        mason.Brick
+    print(json.dumps(memory()), flush=True)
+    # stay alive until every worker has been measured
+    sys.stdin.read()
+    sys.exit()
+
+qudt = sys.argv[1]
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+db = os.path.splitext(qudt)[0] + ".db"
+if not os.path.exists(db):
+    import brickschema
+    import store
+    g = brickschema.Graph()
+    g.parse("Brick.ttl", format="ttl")
+    g.parse(qudt, format="ttl")
+    store.build_store(db, g)
+
+modes = (
+    ("imports only", "baseline", {}),
+    ("in-memory", "mason", {"MASON_QUDT": qudt}),
+    ("store", "mason", {"MASON_STORE": db}),
+)
+for (mode, worker, env) in modes:
+    t = time.time()
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "worker", worker], env=dict(os.environ, **env),
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    usage = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    rss = sum(u["rss"] for u in usage) / workers
+    pss = sum(u["pss"] for u in usage) / workers
+    print(f"{mode}: {workers} workers, {time.time() - t:.1f}s, per worker RSS {rss:.0f} MB, PSS {pss:.0f} MB")
@@ -0,0 +1,103 @@
+"""
+Compares validating a model against the full Brick shapes graph with the
+pruned shapes graph compile_model uses, and times compile_model.
+
+    python scratch/bench_validation.py [vavs]
+
+Run from the repository root.
+"""
+import os
+import sys
+import time
+import rdflib
+import pyshacl
+from brickschema import namespaces as ns
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mason
+from mason import Brick, compile_model
+from service import model_terms
+
+BLDG = rdflib.Namespace("urn:example#")
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+
+def reset():
+    del mason.Entity._all_entities[:]
+    del mason.shapegen.EntityProperty._instances[:]
+
+
+def sound_model():
+    bldg = Brick.Building(BLDG["bldg"], "Building")
+    fl = Brick.Floor(BLDG["floor1"], "Floor 1")
+    bldg.add_hasPart(fl)
+    ahu = Brick.AHU(BLDG["ahu1"], "AHU 1")
+    bldg.add_isLocationOf(ahu)
+    for i in range(N):
+        vav = Brick.VAV(BLDG[f"vav{i}"])
+        vav.add_hasPoint(Brick.Supply_Air_Temperature_Sensor(BLDG[f"sat{i}"]))
+        vav.add_hasPoint(Brick.Supply_Air_Temperature_Setpoint(BLDG[f"sp{i}"]))
+        ahu.add_feeds(vav)
+        rm = Brick.Room(BLDG[f"room{i}"])
+        fl.add_hasPart(rm)
+        rm.add_area(Brick.EntityProperty.AreaShape(10.0, Brick.Unit.Square_Metre))
+    # a unit attached to an entity rather than to an entity property
+    Brick.Temperature_Sensor(BLDG["area_sensor"]).add_hasUnit(Brick.Unit.Square_Metre)
+
+
+def bad_model():
+    sound_model()
+    sen = Brick.Temperature_Sensor(BLDG["bad_sensor"])
+    sen.add_hasLocation(Brick.Temperature_Sensor(BLDG["other_sensor"]))
+    sen.add_measures(Brick.AHU(BLDG["bad_ahu"]))
+
+
+def results(report):
+    return {
+        (report.value(r, ns.SH.focusNode), report.value(r, ns.SH.sourceConstraintComponent),
+         report.value(r, ns.SH.resultPath), report.value(r, ns.SH.sourceShape))
+        for r in report.subjects(ns.A, ns.SH.ValidationResult)
+    }
+
+
+def compare(name):
+    # full and pruned validation must report exactly the same results
+    g = compile_model([("bldg", BLDG)], validate=False)
+    shapes, ontology = Brick.validation_graphs(*model_terms(g))
+
+    t = time.time()
+    valid, _, _ = g.validate()
+    print(f"{name}: previous compile_model (no Brick shapes): {time.time() - t:.2f}s valid={valid}")
+
+    t = time.time()
+    full_valid, full, _ = pyshacl.validate(g + ontology, shacl_graph=Brick.graph, ont_graph=Brick.graph)
+    print(f"{name}: full shapes graph: {time.time() - t:.2f}s valid={full_valid}")
+
+    t = time.time()
+    pruned_valid, pruned, _ = pyshacl.validate(g + ontology, shacl_graph=shapes)
+    print(f"{name}: pruned shapes graph: {time.time() - t:.2f}s valid={pruned_valid}")
+
+    assert full_valid == pruned_valid
+    assert results(full) == results(pruned), results(full) ^ results(pruned)
+    print(f"{name}: {len(results(full))} violations, same for full and pruned")
+    for r in sorted(results(full)):
+        print("   ", r[0], r[1].split("#")[-1])
+
+
+reset()
+sound_model()
+compare("sound model")
+for run in ("cold", "warm"):
+    if run == "cold":
+        Brick._validation_cache.clear()
+    t = time.time()
+    compile_model([("bldg", BLDG)])
+    print(f"compile_model ({run} cache): {time.time() - t:.2f}s")
+t = time.time()
+compile_model([("bldg", BLDG)], fast=True)
+print(f"compile_model (fast): {time.time() - t:.2f}s")
+
+reset()
+bad_model()
+compare("bad model")
@@ -0,0 +1,271 @@
+"""
+Long-lived model-building service. Holds one warm BrickClassGenerator and
+accepts build, compile and validate requests over a Unix socket, so jobs only
+pay for the work on their own model.
+
+Requests and responses are newline-delimited JSON objects. A model is
+described as:
+    {
+        "binds": {"bldg": "urn:bldg#"},
+        "entities": [{"uri": "urn:bldg#ahu1", "class": "AHU", "label": "AHU 1"}],
+        "relationships": [["urn:bldg#ahu1", "feeds", "urn:bldg#vav1"]],
+        "properties": [{"entity": "urn:bldg#room1", "property": "area",
+                        "shape": "AreaShape",
+                        "fields": {"value": 10.0, "hasUnit": "Square_Metre"}}]
+    }
+
+Run offline by pointing MASON_QUDT at a local copy of the QUDT units:
+    MASON_QUDT=unit.ttl python service.py --socket /tmp/mason.sock
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import time
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import rdflib
+import pyshacl
+from brickschema import namespaces as ns
+import mason
+
+DEFAULT_SOCKET = "/tmp/mason.sock"
+# number of serialized (shapes, ontology) graph pairs kept for the workers
+SERIALIZED_CACHE_SIZE = 64
+OPS = ("build", "compile", "validate", "metrics")
+
+
+def _validate(data, shapes, ontology):
+    """
+    Runs SHACL validation in a worker process; graphs are passed as N-Triples
+    """
+    g = rdflib.Graph()
+    g.parse(data=data, format="nt")
+    g.parse(data=ontology, format="nt")
+    shapes_graph = rdflib.Graph()
+    shapes_graph.parse(data=shapes, format="nt")
+    valid, _, report = pyshacl.validate(g, shacl_graph=shapes_graph)
+    return valid, report
+
+
+def model_terms(g):
+    """
+    Returns the classes, predicates and external nodes (objects which are not
+    described in the graph, e.g. units) used by the data graph g
+    """
+    classes = set(g.objects(None, ns.A))
+    predicates = set(g.predicates())
+    subjects = set(g.subjects())
+    nodes = {o for o in g.objects() if isinstance(o, rdflib.URIRef)} - subjects - classes
+    return classes, predicates, nodes
+
+
+class MasonService:
+    def __init__(self, brick=None, workers=None):
+        # mason.Brick is only built (fetching QUDT unless MASON_QUDT or
+        # MASON_STORE is set) when no generator is given
+        self.brick = brick if brick is not None else mason.Brick
+        # the validation workers are started from a forkserver, so they do not
+        # inherit the generator and only import this module
+        workers = workers or os.cpu_count()
+        self._pool = ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context("forkserver"))
+        # validations hold a slot while they run in a worker, so the ones
+        # waiting for a slot are the queue
+        self._slots = asyncio.Semaphore(workers)
+        self._serialized = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._in_flight = 0
+        self._requests = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._latencies = defaultdict(lambda: deque(maxlen=1000))
+        self._started = time.time()
+
+    def build(self, model):
+        """
+        Builds the model description into a (not validated) Brick graph
+        """
+        Entity = mason.Entity
+        instances = mason.shapegen.EntityProperty._instances
+        # the entity registries are global; builds run one at a time on the
+        # event loop, so clear them around each build
+        del Entity._all_entities[:]
+        del instances[:]
+        try:
+            entities = {}
+            for defn in model.get("entities", []):
+                klass = getattr(self.brick, defn["class"])
+                uri = rdflib.URIRef(defn["uri"])
+                entities[defn["uri"]] = klass(uri, defn.get("label"))
+            for (subj, rel, obj) in model.get("relationships", []):
+                getattr(entities[subj], f"add_{rel}")(entities[obj])
+            for defn in model.get("properties", []):
+                kls = getattr(self.brick.EntityProperty, defn["shape"])
+                fields = dict(defn.get("fields", {}))
+                if isinstance(fields.get("hasUnit"), str):
+                    fields["hasUnit"] = getattr(self.brick.Unit, fields["hasUnit"])
+                getattr(entities[defn["entity"]], f"add_{defn['property']}")(kls(**fields))
+            binds = [(pfx, rdflib.Namespace(uri)) for pfx, uri in model.get("binds", {}).items()]
+            return mason.compile_model(binds, validate=False, brick=self.brick)
+        finally:
+            del Entity._all_entities[:]
+            del instances[:]
+
+    def _validation_graphs(self, g):
+        """
+        Returns the serialized pruned (shapes, ontology) graphs for g; the
+        most recently used are cached, like the graphs in the generator
+        """
+        terms = model_terms(g)
+        key = tuple(frozenset(t) for t in terms)
+        if key in self._serialized:
+            self._serialized.move_to_end(key)
+        else:
+            shapes, ontology = self.brick.validation_graphs(*terms)
+            self._serialized[key] = (shapes.serialize(format="nt"), ontology.serialize(format="nt"))
+            if len(self._serialized) > SERIALIZED_CACHE_SIZE:
+                self._serialized.popitem(last=False)
+        return self._serialized[key]
+
+    async def validate(self, g):
+        shapes, ontology = self._validation_graphs(g)
+        data = g.serialize(format="nt")
+        loop = asyncio.get_running_loop()
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        self._running += 1
+        try:
+            return await loop.run_in_executor(self._pool, _validate, data, shapes, ontology)
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    async def handle(self, request):
+        op = request.get("op")
+        if op == "build":
+            g = self.build(request["model"])
+            return {"graph": g.serialize(format="ttl")}
+        elif op == "compile":
+            g = self.build(request["model"])
+            valid, report = await self.validate(g)
+            return {"graph": g.serialize(format="ttl"), "valid": valid, "report": report}
+        elif op == "validate":
+            g = rdflib.Graph()
+            g.parse(data=request["graph"], format="ttl")
+            valid, report = await self.validate(g)
+            return {"valid": valid, "report": report}
+        elif op == "metrics":
+            return self.metrics()
+        raise ValueError(f"Unknown op {op!r}")
+
+    def metrics(self):
+        latencies = {}
+        for op, samples in self._latencies.items():
+            ordered = sorted(samples)
+            latencies[op] = {
+                "mean_ms": statistics.mean(ordered),
+                "p50_ms": ordered[len(ordered) // 2],
+                "p95_ms": ordered[int(len(ordered) * 0.95)],
+                "max_ms": ordered[-1],
+            }
+        return {
+            "uptime_s": time.time() - self._started,
+            "queue_depth": self._queued,
+            "validating": self._running,
+            "in_flight": self._in_flight,
+            "requests": dict(self._requests),
+            "errors": dict(self._errors),
+            "latency": latencies,
+        }
+
+    async def _respond(self, line, writer, lock):
+        start = time.perf_counter()
+        request = op = None
+        failed = False
+        self._in_flight += 1
+        try:
+            request = json.loads(line)
+            op = request.get("op")
+            response = {"id": request.get("id"), "ok": True}
+            response.update(await self.handle(request))
+        except Exception as e:
+            failed = True
+            response = {"id": request.get("id") if isinstance(request, dict) else None,
+                        "ok": False, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            self._in_flight -= 1
+        # metrics are keyed by op; anything else the clients send is counted
+        # together so it cannot grow them
+        if op not in OPS:
+            op = "unknown"
+        self._requests[op] += 1
+        if failed:
+            self._errors[op] += 1
+        self._latencies[op].append((time.perf_counter() - start) * 1000)
+        async with lock:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+    async def _connection(self, reader, writer):
+        # requests on one connection are handled concurrently and answered
+        # as they finish; clients match responses by "id"
+        lock = asyncio.Lock()
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(self._respond(line, writer, lock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+    async def serve(self, path=DEFAULT_SOCKET):
+        server = await asyncio.start_unix_server(self._connection, path=path)
+        async with server:
+            await server.serve_forever()
+
+
+class MasonClient:
+    """
+    Thin blocking client for MasonService; one request per connection
+    """
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.path = path
+
+    def _request(self, **request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+        if not response.pop("ok"):
+            raise Exception(response["error"])
+        return response
+
+    def build(self, model):
+        return self._request(op="build", model=model)["graph"]
+
+    def compile(self, model):
+        return self._request(op="compile", model=model)
+
+    def validate(self, graph):
+        return self._request(op="validate", graph=graph)
+
+    def metrics(self):
+        return self._request(op="metrics")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="mason model-building service")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--workers", type=int, default=None, help="validation worker processes")
+    args = parser.parse_args()
+    asyncio.run(MasonService(workers=args.workers).serve(args.socket))
@@ -13,15 +13,33 @@ class {{ shape_name }}(EntityProperty):
     {{ name }}: {{ type }}
     {% endfor %}
 
-    {% if possible_values %}
-    possible_values = {{ possible_values }}
-    {% endif %}
+    {% for (name, attr, vals) in enum_props %}
+    {{ attr }} = {{ vals }}
+    _{{ attr }}_set = frozenset({{ attr }})
+    {% endfor %}
 
     {% if possible_units %}
     possible_units = {{ possible_units }}
+    _possible_units_set = frozenset(possible_units)
     {% endif %}
 
     def __post_init__(self):
+        {% for name in required_props %}
+        if self.{{ name }} is None:
+            raise ValueError("{{ shape_name }}.{{ name }} is required")
+        {% endfor %}
+        {% for (name, ptype) in typed_props %}
+        if self.{{ name }} is not None and (isinstance(self.{{ name }}, bool) or not isinstance(self.{{ name }}, {{ ptype }})):
+            raise TypeError(f"{{ shape_name }}.{{ name }} must be of type {{ ptype }}, not {type(self.{{ name }}).__name__}")
+        {% endfor %}
+        {% for (name, attr, vals) in enum_props %}
+        if self.{{ name }} is not None and self.{{ name }} not in self._{{ attr }}_set:
+            raise ValueError(f"{self.{{ name }}!r} is not a possible {{ name }} of {{ shape_name }}")
+        {% endfor %}
+        {% if possible_units %}
+        if self.hasUnit is not None and getattr(self.hasUnit, 'URI', self.hasUnit) not in self._possible_units_set:
+            raise ValueError(f"{self.hasUnit!r} is not a possible unit of {{ shape_name }}")
+        {% endif %}
         self.URI = BNode()
         self.classURI = rdflib.URIRef("{{ shape }}")
         EntityProperty._instances.append(self)
@@ -37,6 +55,15 @@ lookup = {
     XSD['string']: 'str',
 }
 
+# Python types accepted by the generated __post_init__ checks for each
+# annotation; ints are allowed wherever a float is expected. bools are
+# always rejected, even though they are ints
+check_types = {
+    'float': '(float, int)',
+    'int': 'int',
+    'str': 'str',
+}
+
 def get_type(defn):
     """
     if not 'required', wrap in Optional
@@ -75,6 +102,22 @@ def get_val(thing):
         return thing.toPython()
     return thing
 
+def add_prop(args, prop_name, defn):
+    """
+    Adds the field annotation for prop_name to the template args, along with
+    the checks __post_init__ should run on it (required, datatype, enum values)
+    """
+    args['shape_props'].append((prop_name, get_type(defn)))
+    if enum_vals := defn.get('enum_vals'):
+        # 'value' keeps its original possible_values name
+        attr = 'possible_values' if prop_name == 'value' else f'possible_{prop_name}'
+        args['enum_props'].append((prop_name, attr, [get_val(x) for x in enum_vals]))
+    if defn.get('required', False):
+        args['required_props'].append(prop_name)
+    if dtype := defn.get('datatype'):
+        if ptype := check_types.get(lookup.get(dtype, dtype)):
+            args['typed_props'].append((prop_name, ptype))
+
 def make_shape_class(shape, defn):
     """
     defn is of form:
@@ -92,6 +135,9 @@ def make_shape_class(shape, defn):
         'shape': shape,
         'shape_name': shape_name,
         'shape_props': [],
+        'required_props': [],
+        'typed_props': [],
+        'enum_props': [],
     }
     # rewrite property names
     prop_names = list(defn.keys())[:]
@@ -102,16 +148,16 @@ def make_shape_class(shape, defn):
     # do 'value' first if it exists
     if 'value' in defn:
         value_def = defn.pop('value')
-        if 'enum_vals' in value_def:
-            args['possible_values'] = [get_val(x) for x in value_def['enum_vals']]
-        args['shape_props'].append(('value', get_type(value_def)))
+        add_prop(args, 'value', value_def)
     if 'hasUnit' in defn:
         value_def = defn.pop('hasUnit')
         if 'enum_vals' in value_def:
             args['possible_units'] = [get_val(x) for x in value_def['enum_vals']]
         args['shape_props'].append(('hasUnit', "Unit"))
+        if value_def.get('required', False):
+            args['required_props'].append('hasUnit')
     for prop_name, value_def in defn.items():
-        args['shape_props'].append((prop_name, get_type(value_def)))
+        add_prop(args, prop_name, value_def)
 
     #print(t.render(**args))
     exec(compile(t.render(**args), '<string>', 'exec'), globals(), locals())
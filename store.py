@@ -0,0 +1,194 @@
+"""
+Read-only, on-disk rdflib store for the Brick and QUDT ontologies.
+
+The store is an SQLite database built once with build_store (or by running
+this module). Any number of processes can open it at the same time; the file
+is memory-mapped, so its pages are shared through the OS page cache instead
+of every process parsing the ontology into its own in-memory Graph.
+
+    python store.py -o ontology.db Brick.ttl unit.ttl
+    Brick = BrickClassGenerator(open_graph("ontology.db"), qudt_source=None)
+"""
+import argparse
+import os
+import sqlite3
+from functools import lru_cache
+import rdflib
+import brickschema
+from rdflib.store import Store, VALID_STORE
+
+# how much of the database file to memory-map
+MMAP_SIZE = 1 << 30
+
+SCHEMA = """
+CREATE TABLE terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT,
+    lang TEXT
+);
+CREATE INDEX terms_value ON terms(value);
+CREATE TABLE triples (s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL);
+CREATE INDEX triples_spo ON triples(s, p, o);
+CREATE INDEX triples_pos ON triples(p, o, s);
+CREATE INDEX triples_osp ON triples(o, s, p);
+CREATE TABLE namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+"""
+
+
+def _encode(term):
+    if isinstance(term, rdflib.Literal):
+        datatype = str(term.datatype) if term.datatype is not None else None
+        return ('L', str(term), datatype, term.language)
+    elif isinstance(term, rdflib.BNode):
+        return ('B', str(term), None, None)
+    return ('U', str(term), None, None)
+
+
+def _decode(kind, value, datatype, lang):
+    if kind == 'L':
+        return rdflib.Literal(value, lang=lang, datatype=datatype)
+    elif kind == 'B':
+        return rdflib.BNode(value)
+    return rdflib.URIRef(value)
+
+
+def build_store(path, graph):
+    """
+    Writes the triples and namespace bindings of graph to a new store at path.
+    The store is built next to path and renamed into place, replacing any
+    existing store; processes which have the old one open keep reading it.
+    """
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.executescript(SCHEMA)
+    ids = {}
+
+    def term_id(term):
+        key = _encode(term)
+        if key not in ids:
+            ids[key] = len(ids) + 1
+        return ids[key]
+
+    conn.executemany("INSERT INTO triples VALUES (?, ?, ?)",
+                     ((term_id(s), term_id(p), term_id(o)) for (s, p, o) in graph))
+    conn.executemany("INSERT INTO terms VALUES (?, ?, ?, ?, ?)",
+                     ((i,) + key for (key, i) in ids.items()))
+    conn.executemany("INSERT OR REPLACE INTO namespaces VALUES (?, ?)",
+                     ((pfx, str(uri)) for (pfx, uri) in graph.namespaces()))
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    os.replace(tmp, path)
+
+
+class SQLiteStore(Store):
+    """
+    Read-only rdflib Store over a database written by build_store. Namespace
+    bindings are loaded from the database and can be changed in memory.
+    """
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None, term_cache_size=1 << 16):
+        self._conn = None
+        self._namespaces = {}
+        self._prefixes = {}
+        self._term = lru_cache(maxsize=term_cache_size)(self._load_term)
+        self._term_id = lru_cache(maxsize=term_cache_size)(self._load_term_id)
+        super().__init__(configuration, identifier)
+
+    def open(self, configuration, create=False):
+        self._conn = sqlite3.connect(f"file:{configuration}?mode=ro", uri=True,
+                                     check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self._conn.execute("PRAGMA query_only = 1")
+        for (pfx, uri) in self._conn.execute("SELECT prefix, uri FROM namespaces"):
+            self.bind(pfx, rdflib.URIRef(uri))
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _load_term(self, term_id):
+        row = self._conn.execute(
+            "SELECT kind, value, datatype, lang FROM terms WHERE id = ?", (term_id,)
+        ).fetchone()
+        return _decode(*row)
+
+    def _load_term_id(self, term):
+        row = self._conn.execute(
+            "SELECT id FROM terms WHERE kind = ? AND value = ? AND datatype IS ? AND lang IS ?",
+            _encode(term),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def triples(self, triple_pattern, context=None):
+        clauses = []
+        params = []
+        for (col, term) in zip("spo", triple_pattern):
+            if term is None:
+                continue
+            term_id = self._term_id(term)
+            if term_id is None:
+                return
+            clauses.append(f"{col} = ?")
+            params.append(term_id)
+        sql = "SELECT s, p, o FROM triples"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        for (s, p, o) in self._conn.execute(sql, params):
+            yield (self._term(s), self._term(p), self._term(o)), iter(())
+
+    def __len__(self, context=None):
+        return self._conn.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def add(self, triple, context, quoted=False):
+        raise Exception("SQLiteStore is read-only")
+
+    def remove(self, triple, context=None):
+        raise Exception("SQLiteStore is read-only")
+
+    def bind(self, prefix, namespace, override=True):
+        if not override and (prefix in self._namespaces or namespace in self._prefixes):
+            return
+        self._namespaces.pop(self._prefixes.pop(namespace, None), None)
+        self._prefixes.pop(self._namespaces.pop(prefix, None), None)
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespaces(self):
+        yield from self._namespaces.items()
+
+
+def open_graph(path):
+    """
+    Returns a brickschema.Graph backed by the read-only store at path
+    """
+    g = brickschema.Graph(store=SQLiteStore())
+    g.open(path)
+    return g
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="build a mason ontology store")
+    parser.add_argument("sources", nargs="+", help="ontology files (e.g. Brick.ttl and the QUDT units)")
+    parser.add_argument("-o", "--output", default="ontology.db", help="database path")
+    args = parser.parse_args()
+    g = brickschema.Graph()
+    for source in args.sources:
+        g.parse(source, format="ttl")
+    build_store(args.output, g)